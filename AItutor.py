@@ -1,12 +1,24 @@
 import streamlit as st
-import json
+import orjson
+import matplotlib
+matplotlib.use("Agg")  # Headless backend; figures are only rendered through st.pyplot
 import matplotlib.pyplot as plt
-import pandas as pd
 import google.generativeai as genai
 import io
-import sys
-import graphviz
+import contextlib
+import asyncio
+import atexit
+import functools
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 import os
+from tutor_content import QUICK_QUESTIONS, COMPARISON_TABLES, VISUALIZATIONS, COMPARISON_OPTIONS, VISUALIZATION_OPTIONS
+
+if TYPE_CHECKING:
+    import pandas as pd  # Annotations only; loaded lazily in get_comparison_table
 
 # ✅ Securely Fetch API Key from Streamlit Secrets
 API_KEY = st.secrets.get("GEMINI_API_KEY")
@@ -19,30 +31,288 @@ if not API_KEY:
 # ✅ Configure Google GenAI
 genai.configure(api_key=API_KEY)
 
+# ✅ Build the Gemini Model Once per Process
+@st.cache_resource
+def _get_model(name="gemini-1.5-flash"):
+    return genai.GenerativeModel(name)
+
+# ✅ Proactive Rate Limiting (pace requests, back off on 429 / quota errors)
+MAX_CONCURRENT_REQUESTS = 4
+MIN_REQUEST_INTERVAL = 1.0  # seconds between request starts, shared by all sessions
+MAX_ATTEMPTS = 3
+BACKOFF_BASE, BACKOFF_MIN, BACKOFF_MAX = 2.0, 1.0, 30.0
+
+# Streamlit re-executes this script on every rerun, so the shared pacing state
+# lives in a cached resource instead of plain module globals.
+@st.cache_resource
+def _get_request_pacer():
+    return {
+        "slots": threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS),
+        "lock": threading.Lock(),
+        "next_request_at": 0.0,
+    }
+
+def _reserve_request_delay():
+    """Reserve the next start time on the shared monotonic gate and return the wait."""
+    pacer = _get_request_pacer()
+    with pacer["lock"]:
+        now = time.monotonic()
+        start = max(now, pacer["next_request_at"])
+        pacer["next_request_at"] = start + MIN_REQUEST_INTERVAL
+    return start - now
+
+def _is_rate_limited(error):
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "resource exhausted" in message
+
+def _backoff_delay(attempt):
+    return min(BACKOFF_MAX, max(BACKOFF_MIN, BACKOFF_BASE * 2 ** attempt))
+
+def rate_limited(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(MAX_ATTEMPTS):
+            with _get_request_pacer()["slots"]:
+                time.sleep(_reserve_request_delay())
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if not _is_rate_limited(e) or attempt == MAX_ATTEMPTS - 1:
+                        raise
+            time.sleep(_backoff_delay(attempt))
+    return wrapper
+
+def async_rate_limited(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        slots = _get_request_pacer()["slots"]
+        for attempt in range(MAX_ATTEMPTS):
+            # Take the same process-wide slot as the sync path, without blocking the loop
+            await asyncio.get_running_loop().run_in_executor(None, slots.acquire)
+            try:
+                await asyncio.sleep(_reserve_request_delay())
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+            finally:
+                slots.release()
+            await asyncio.sleep(_backoff_delay(attempt))
+    return wrapper
+
+NO_RESPONSE_MESSAGE = "⚠️ AI could not generate a response."
+
+class EmptyResponseError(Exception):
+    """The model returned no text for a prompt."""
+
+def _response_text(response):
+    text = response.text if response else ""  # .text re-joins the candidate parts on every access
+    return text.strip() if text else NO_RESPONSE_MESSAGE
+
+# ✅ Memoize Identical Prompts (errors are raised, so they are never cached)
+@st.cache_data(show_spinner=False, ttl=3600)
+@rate_limited
+def _cached_ai(prompt: str) -> str:
+    model = _get_model()
+    response = model.generate_content(prompt)
+    text = _response_text(response)
+    if text == NO_RESPONSE_MESSAGE:
+        raise EmptyResponseError()  # Raised, not returned, so the placeholder is never cached
+    return text
+
 # ✅ Function to Get AI Response
 def get_ai_response(user_input):
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(user_input)
-        return response.text.strip() if response and response.text else "⚠️ AI could not generate a response."
+        return _cached_ai(user_input)
+    except EmptyResponseError:
+        return NO_RESPONSE_MESSAGE
     except Exception as e:
         return f"⚠️ API Error: {str(e)}"
 
-# ✅ Load & Save Chat History
-CHAT_HISTORY_FILE = "chat_history.json"
+# ✅ Stream AI Response Chunks as They Arrive
+@rate_limited
+def _start_stream(prompt):
+    return _get_model().generate_content(prompt, stream=True)
+
+def stream_ai_response(user_input, errors):
+    """Yield answer text; API errors go to `errors` instead of into the answer."""
+    try:
+        for chunk in _start_stream(user_input):
+            if chunk.parts:  # Finish/safety chunks have no parts and .text would raise
+                yield chunk.text
+    except Exception as e:
+        errors.append(e)
+
+# ✅ Concurrent Dispatch of Several Prompts
+# The SDK's async client binds its grpc.aio channel to the first loop it runs on,
+# so all async calls share one long-lived loop on a background thread.
+@st.cache_resource
+def _get_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="genai-event-loop", daemon=True).start()
+    return loop
+
+@async_rate_limited
+async def _aget(prompt):
+    response = await _get_model().generate_content_async(prompt)
+    return _response_text(response)
+
+def _gather_ai(prompts):
+    async def _run():
+        return await asyncio.gather(*[_aget(p) for p in prompts], return_exceptions=True)
+    return asyncio.run_coroutine_threadsafe(_run(), _get_event_loop()).result()
+
+# ✅ Prefetch Quick-Question Answers at Warmup
+# (Gemini treats a list of prompts as one multi-part message, so fan out instead)
+@st.cache_data(show_spinner="Preparing quick questions...", ttl=86400)
+def _prefetch_quick(qs: tuple) -> dict:
+    # Failed or empty answers are left out so their buttons fall back to a live request
+    return {
+        q: r for q, r in zip(qs, _gather_ai(qs))
+        if not isinstance(r, Exception) and r != NO_RESPONSE_MESSAGE
+    }
+
+# ✅ Load & Save Chat History (append-only NDJSON: one record per line)
+CHAT_HISTORY_FILE = "chat_history.ndjson"
+LEGACY_CHAT_HISTORY_FILE = "chat_history.json"
+IO_BUFFER_SIZE = 65536
+
+def _write_records(f, records):
+    for record in records:
+        f.write(orjson.dumps(record) + b"\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+def _rewrite_chat_history(records):
+    # Write a temp file and rename it over the target so a crash never leaves it half-written
+    tmp_file = CHAT_HISTORY_FILE + ".tmp"
+    with open(tmp_file, "wb", buffering=IO_BUFFER_SIZE) as f:
+        _write_records(f, records)
+    os.replace(tmp_file, CHAT_HISTORY_FILE)
 
 def load_chat_history():
+    # Read and any migration/repair rewrite happen under the file lock, so a
+    # concurrent flush can't append to a file that is about to be replaced
+    with _get_history_buffer()["file_lock"]:
+        return _read_chat_history()
+
+def _read_chat_history():
     if not os.path.exists(CHAT_HISTORY_FILE):
-        return []
-    try:
-        with open(CHAT_HISTORY_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []  # Return empty chat history if file is corrupt
+        if not os.path.exists(LEGACY_CHAT_HISTORY_FILE):
+            return []
+        try:
+            with open(LEGACY_CHAT_HISTORY_FILE, "rb") as f:
+                history = orjson.loads(f.read())
+        except orjson.JSONDecodeError:
+            return []  # Return empty chat history if file is corrupt
+        _rewrite_chat_history(history)
+        return history
+    history = []
+    corrupt = False
+    with open(CHAT_HISTORY_FILE, "rb", buffering=IO_BUFFER_SIZE) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                history.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                corrupt = True  # Skip a partially written line
+    if corrupt:
+        _rewrite_chat_history(history)  # Repair once instead of re-skipping on every load
+    return history
+
+def save_chat_history(records):
+    with open(CHAT_HISTORY_FILE, "ab", buffering=IO_BUFFER_SIZE) as f:
+        _write_records(f, records)
+
+def _clear_history_file(buffer):
+    with buffer["file_lock"]:
+        _rewrite_chat_history([])
+        with buffer["lock"]:
+            buffer["pending_clears"] -= 1
+            records = []
+            if not buffer["pending_clears"]:
+                records, buffer["records"] = buffer["records"], []
+        if records:
+            save_chat_history(records)  # Appended after the click; flushes held them back
+
+def clear_chat_history():
+    # Drop the unwritten records now, so anything appended after the click survives;
+    # only the file rewrite goes through the I/O pool, ordered with queued flushes
+    buffer = _get_history_buffer()
+    with buffer["lock"]:
+        buffer["records"] = []
+        buffer["pending_clears"] += 1
+    _get_io_pool().submit(_clear_history_file, buffer)
+
+# ✅ Debounced Persistence (session state is canonical, disk is flushed in batches)
+FLUSH_EVERY_RECORDS = 5
+FLUSH_INTERVAL = 10.0  # seconds
+
+def _flush_history_buffer(buffer):
+    # "lock" guards only the record list, so appends never wait on the disk write
+    with buffer["file_lock"]:
+        with buffer["lock"]:
+            if buffer["pending_clears"]:
+                return  # Left for the pending clear to write once the file is rewritten
+            records, buffer["records"] = buffer["records"], []
+        if records:
+            save_chat_history(records)
+
+@st.cache_resource
+def _get_history_buffer():
+    # Shared by every rerun and session; flushed one last time on shutdown
+    buffer = {"records": [], "pending_clears": 0, "lock": threading.Lock(), "file_lock": threading.Lock()}
+    atexit.register(_flush_history_buffer, buffer)
+    return buffer
+
+@st.cache_resource
+def _get_io_pool():
+    # A single worker keeps flushes ordered without extra locking
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-history-io")
+
+def append_chat_record(record):
+    st.session_state.chat_history.append(record)
+    buffer = _get_history_buffer()
+    with buffer["lock"]:
+        buffer["records"].append(record)
+    st.session_state.dirty_since_flush += 1
 
-def save_chat_history():
-    with open(CHAT_HISTORY_FILE, "w") as f:
-        json.dump(st.session_state.chat_history, f, indent=4)
+def flush_chat_history():
+    _get_io_pool().submit(_flush_history_buffer, _get_history_buffer())
+    st.session_state.dirty_since_flush = 0
+    st.session_state.last_flush = time.time()
+
+AI_MESSAGE_HEADER = "**🤖 AI Assistant (AI):** "
+
+def render_chat_message(chat):
+    # A single markdown element per message: as cheap as one element can be, and an
+    # unclosed fence or list in one reply can't spill into the messages after it
+    icon = "👤" if chat["role"] in ["User", "Admin"] else "🤖"
+    st.markdown(f"**{icon} {chat['username']} ({chat['role']}):** {chat['message']}")
+
+def maybe_flush_chat_history():
+    dirty = st.session_state.dirty_since_flush
+    if dirty >= FLUSH_EVERY_RECORDS or (dirty and time.time() - st.session_state.last_flush > FLUSH_INTERVAL):
+        flush_chat_history()
+
+# ✅ Cached Comparison Tables & Visualizations
+@st.cache_data
+def get_comparison_table(option: str) -> "pd.DataFrame | None":
+    table = COMPARISON_TABLES.get(option)
+    if table is None:
+        return None
+    import pandas as pd  # Only paid for once the comparisons panel is used
+    return pd.DataFrame(dict(table))
+
+@st.cache_data
+def get_visualization(option: str) -> str | None:
+    return VISUALIZATIONS.get(option)
+
+# ✅ Compile User Code Once per Distinct Source
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _compile(src: str):
+    return compile(src, "<user>", "exec")
 
 # ✅ Initialize Session State Variables
 if "chat_history" not in st.session_state:
@@ -53,17 +323,28 @@ if "dark_mode" not in st.session_state:
     st.session_state.dark_mode = False
 if "code" not in st.session_state:
     st.session_state.code = ""
+if "exec_globals" not in st.session_state:
+    st.session_state.exec_globals = {}  # Persists across runs, Jupyter-style
+if "dirty_since_flush" not in st.session_state:
+    st.session_state.dirty_since_flush = 0
+if "last_flush" not in st.session_state:
+    st.session_state.last_flush = time.time()
 
 # ✅ Streamlit Page Config
 st.set_page_config(page_title="AI Data Science Tutor", page_icon="🤖", layout="wide")
 
+# Also catches the time-based flush on reruns that add no messages
+maybe_flush_chat_history()
+
 # ✅ Authentication System
 if not st.session_state.logged_in:
     st.title("🔑 Login to AI Data Science Tutor")
-    username = st.text_input("Enter your username:")
-    role = st.selectbox("Select Role:", ["User", "Admin"])
-    
-    if st.button("Login"):
+    with st.form("login"):
+        username = st.text_input("Enter your username:")
+        role = st.selectbox("Select Role:", ["User", "Admin"])
+        submitted = st.form_submit_button("Login")
+
+    if submitted:
         if not username:
             st.warning("Please enter your username to proceed.")
         else:
@@ -94,7 +375,9 @@ st.session_state.dark_mode = st.sidebar.toggle("🌙 Dark Mode", value=st.sessio
 st.sidebar.title("📜 Chat History")
 if st.sidebar.button("🗑 Clear Chat History"):
     st.session_state.chat_history = []
-    save_chat_history()
+    clear_chat_history()
+if st.sidebar.button("💾 Save Chat History"):
+    flush_chat_history()
 if st.sidebar.button("📥 Download Chat History"):
     formatted_chat = "\n".join([f"**{chat['username']} ({chat['role']}):** {chat['message']}" for chat in st.session_state.chat_history])
     st.sidebar.download_button(label="Download", data=formatted_chat, file_name="chat_history.txt", mime="text/plain")
@@ -102,75 +385,84 @@ if st.sidebar.button("📥 Download Chat History"):
 st.title("🧠 Conversational AI Data Science Tutor")
 
 # ✅ Quick Questions
-quick_questions = [
-    "What is overfitting in ML?",
-    "Explain bias-variance tradeoff.",
-    "Types of regression?",
-    "Supervised vs. Unsupervised learning?",
-]
-cols = st.columns(len(quick_questions))
-for idx, question in enumerate(quick_questions):
+try:
+    quick_answers = _prefetch_quick(QUICK_QUESTIONS)
+except Exception:
+    quick_answers = {}  # Fall back to per-click requests if the warmup fails
+cols = st.columns(len(QUICK_QUESTIONS))
+for idx, question in enumerate(QUICK_QUESTIONS):
     if cols[idx].button(question):
-        st.session_state.chat_history.append({
+        append_chat_record({
             "username": st.session_state.username,
             "role": st.session_state.role,
             "message": question
         })
-        response = get_ai_response(question)
-        st.session_state.chat_history.append({
+        response = quick_answers.get(question) or get_ai_response(question)
+        append_chat_record({
             "username": "AI Assistant",
             "role": "AI",
             "message": response
         })
-        save_chat_history()
-        st.rerun()
+        maybe_flush_chat_history()  # The chat loop below renders both new messages
 
 # ✅ Chat UI
 st.subheader("🗨 Chat")
 chat_container = st.container()
 with chat_container:
     for chat in st.session_state.chat_history:
-        username = chat["username"]
-        role = chat["role"]
-        message = chat["message"]
-        icon = "👤" if role in ["User", "Admin"] else "🤖"
-        st.markdown(f"**{icon} {username} ({role}):** {message}")
+        render_chat_message(chat)
 
 # ✅ User Input
 user_input = st.chat_input("Ask a Data Science question...")
 if user_input:
-    st.session_state.chat_history.append({
+    user_chat = {
         "username": st.session_state.username,
         "role": st.session_state.role,
         "message": user_input
-    })
-    
-    response = get_ai_response(user_input)
-    
-    st.session_state.chat_history.append({
+    }
+    append_chat_record(user_chat)
+    with chat_container:
+        render_chat_message(user_chat)
+        # Stream the header with the answer so the new turn is one element, like the history
+        stream_errors = []
+        streamed = st.write_stream(itertools.chain([AI_MESSAGE_HEADER], stream_ai_response(user_input, stream_errors)))
+        if stream_errors:
+            st.error(f"⚠️ API Error: {str(stream_errors[0])}")
+    streamed = streamed[len(AI_MESSAGE_HEADER):]
+    if streamed and stream_errors:
+        # Mark a cut-off answer in history; the st.error above is gone after the next rerun
+        ai_message = f"{streamed.strip()}\n\n⚠️ Response interrupted: {str(stream_errors[0])}"
+    elif streamed:
+        ai_message = streamed.strip()
+    elif stream_errors:
+        ai_message = f"⚠️ API Error: {str(stream_errors[0])}"
+    else:
+        ai_message = NO_RESPONSE_MESSAGE
+    append_chat_record({
         "username": "AI Assistant",
         "role": "AI",
-        "message": response
+        "message": ai_message
     })
-    
-    save_chat_history()
-    st.rerun()
+
+    maybe_flush_chat_history()
 
 # ✅ Python Code Editor
 st.sidebar.title("📝 Python Code Editor")
-st.session_state.code = st.sidebar.text_area("Write your Python code here:", height=200)
+with st.sidebar.form("code_editor"):
+    code_input = st.text_area("Write your Python code here:", height=200)
+    code_col1, code_col2 = st.columns([0.5, 0.5])
+    run_code = code_col1.form_submit_button("Run Code")
+    clear_code = code_col2.form_submit_button("Clear Code")
+st.session_state.code = code_input
 
-code_col1, code_col2 = st.sidebar.columns([0.5, 0.5])
-if code_col1.button("Run Code"):
+if run_code:
     st.subheader("📝 Python Code Execution")
     st.code(st.session_state.code, language="python")
     try:
-        old_stdout = sys.stdout
-        sys.stdout = io.StringIO()
-        exec_globals = {}
-        exec(st.session_state.code, exec_globals)
-        output = sys.stdout.getvalue()
-        sys.stdout = old_stdout
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            exec(_compile(st.session_state.code), st.session_state.exec_globals)
+        output = buf.getvalue()
         st.subheader("📤 Output:")
         st.code(output, language="python")
         if plt.get_fignums():
@@ -181,28 +473,24 @@ if code_col1.button("Run Code"):
         st.markdown(explanation)
     except Exception as e:
         st.error(f"Error: {e}")
-if code_col2.button("Clear Code"):
+    finally:
+        plt.close("all")  # Don't carry figures (and their memory) into the next run
+if clear_code:
     st.session_state.code = ""
+    st.session_state.exec_globals = {}
     st.rerun()
 
 # ✅ Data Science Comparisons
 st.sidebar.title("📊 Data Comparisons")
-data_option = st.sidebar.selectbox("Select comparison", ["None", "ML Models", "Algorithms"])
-comparison_table = {
-    "ML Models": pd.DataFrame({"Model": ["Linear Regression", "Decision Tree", "SVM"], "Accuracy": [85, 78, 82], "Training Time": ["Fast", "Medium", "Slow"]}),
-    "Algorithms": pd.DataFrame({"Algorithm": ["K-Means", "DBSCAN", "Hierarchical"], "Scalability": ["High", "Medium", "Low"], "Use Case": ["Clustering", "Anomaly Detection", "Dendrogram Analysis"]})
-}.get(data_option, None)
+data_option = st.sidebar.selectbox("Select comparison", COMPARISON_OPTIONS)
+comparison_table = get_comparison_table(data_option)
 
 if comparison_table is not None:
     st.table(comparison_table)
 
 # ✅ Data Science Visualizations
 st.sidebar.title("📊 Data Science Visualizations")
-visualization_option = st.sidebar.selectbox("Select visualization", ["None", "Decision Tree", "Neural Network", "K-Means Clustering"])
-visualizations = {
-    "Decision Tree": "digraph G {A -> B; A -> C;}",
-    "Neural Network": "digraph G {A -> B; B -> C; C -> D;}",
-    "K-Means Clustering": "digraph G {Cluster1 -> Point1; Cluster1 -> Point2; Cluster2 -> Point3;}"
-}
-if visualization_option in visualizations:
-    st.graphviz_chart(visualizations[visualization_option])
+visualization_option = st.sidebar.selectbox("Select visualization", VISUALIZATION_OPTIONS)
+visualization = get_visualization(visualization_option)
+if visualization is not None:
+    st.graphviz_chart(visualization)
@@ -0,0 +1,22 @@
+# ✅ Static Tutor Content
+# Imported (not part of the Streamlit script), so it is built once per process and
+# reused from sys.modules instead of being re-evaluated on every rerun.
+from types import MappingProxyType
+
+QUICK_QUESTIONS = (
+    "What is overfitting in ML?",
+    "Explain bias-variance tradeoff.",
+    "Types of regression?",
+    "Supervised vs. Unsupervised learning?",
+)
+COMPARISON_TABLES = MappingProxyType({
+    "ML Models": MappingProxyType({"Model": ("Linear Regression", "Decision Tree", "SVM"), "Accuracy": (85, 78, 82), "Training Time": ("Fast", "Medium", "Slow")}),
+    "Algorithms": MappingProxyType({"Algorithm": ("K-Means", "DBSCAN", "Hierarchical"), "Scalability": ("High", "Medium", "Low"), "Use Case": ("Clustering", "Anomaly Detection", "Dendrogram Analysis")})
+})
+VISUALIZATIONS = MappingProxyType({
+    "Decision Tree": "digraph G {A -> B; A -> C;}",
+    "Neural Network": "digraph G {A -> B; B -> C; C -> D;}",
+    "K-Means Clustering": "digraph G {Cluster1 -> Point1; Cluster1 -> Point2; Cluster2 -> Point3;}"
+})
+COMPARISON_OPTIONS = ("None", *COMPARISON_TABLES)
+VISUALIZATION_OPTIONS = ("None", *VISUALIZATIONS)